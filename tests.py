@@ -17,7 +17,13 @@ Released under the Apache License 2.0
 # flake8: noqa
 
 from unittest.mock import patch
+import hashlib
+import mimetypes
+import os
 import pathlib
+import threading
+import types
+import urllib.parse
 
 from hypothesis import given
 from hypothesis import settings
@@ -77,10 +83,96 @@ def test_calculate_file_hash():
 def test_calculate_file_hash_with_expected_value():
     # expected and calculated hash match:
     assert userprovided.hashing.calculate_file_hash(pathlib.Path('testfile'), 'sha512', testfile_sha512) == testfile_sha512
+    # case of the expected hash does not matter:
+    assert userprovided.hashing.calculate_file_hash(pathlib.Path('testfile'), 'sha512', testfile_sha512.upper()) == testfile_sha512
     # expected and calculated hash DO NOT match:
     with pytest.raises(ValueError):
         assert userprovided.hashing.calculate_file_hash(pathlib.Path('testfile'), 'sha512', 'foo') == testfile_sha512
 
+def test_calculate_file_hashes():
+    assert userprovided.hashing.calculate_file_hashes(
+        pathlib.Path('testfile'), ['sha224', 'sha256', 'sha512']) == {
+            'sha224': testfile_sha224,
+            'sha256': testfile_sha256,
+            'sha512': testfile_sha512}
+    # duplicate methods:
+    assert userprovided.hashing.calculate_file_hashes(
+        'testfile', ('sha256', 'sha256')) == {'sha256': testfile_sha256}
+    # no hash method:
+    with pytest.raises(ValueError):
+        userprovided.hashing.calculate_file_hashes('testfile', [])
+    # one of the methods is deprecated:
+    with pytest.raises(userprovided.err.DeprecatedHashAlgorithm):
+        userprovided.hashing.calculate_file_hashes('testfile', ['sha256', 'md5'])
+
+
+def test_calculate_file_hash_empty_file(tmp_path):
+    empty_file = tmp_path / 'empty'
+    empty_file.touch()
+    assert userprovided.hashing.calculate_file_hash(empty_file) == 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+
+
+def test_calculate_file_hash_chunks(tmp_path):
+    # Python versions before 3.11 lack hashlib.file_digest:
+    empty_file = tmp_path / 'empty'
+    empty_file.touch()
+    # larger than one chunk:
+    large_file = tmp_path / 'large'
+    content = bytes(range(256)) * (3 * 4096 + 1)
+    large_file.write_bytes(content)
+    with patch('sys.version_info', (3, 10)):
+        assert userprovided.hashing.calculate_file_hash(pathlib.Path('testfile')) == testfile_sha256
+        assert userprovided.hashing.calculate_file_hash(empty_file) == 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+        assert userprovided.hashing.calculate_file_hash(large_file) == hashlib.sha256(content).hexdigest()
+    assert userprovided.hashing.calculate_file_hashes(large_file, ['sha224', 'sha512']) == {
+        'sha224': hashlib.sha224(content).hexdigest(),
+        'sha512': hashlib.sha512(content).hexdigest()}
+    assert userprovided.hashing.calculate_file_hashes('testfile', ['sha224', 'sha512']) == {
+        'sha224': testfile_sha224,
+        'sha512': testfile_sha512}
+
+
+@pytest.mark.parametrize("expected_hash", [
+    'ä' * 64,
+    testfile_sha256.encode('ascii'),
+    42
+])
+def test_calculate_file_hash_invalid_expected_hash(expected_hash):
+    # Input which cannot be a hex digest is a mismatch:
+    with pytest.raises(ValueError):
+        userprovided.hashing.calculate_file_hash(
+            pathlib.Path('testfile'), expected_hash=expected_hash)
+
+
+def test_calculate_file_hash_not_regular(tmp_path):
+    # Files in /proc report a size of 0, but have content:
+    fake_stat = types.SimpleNamespace(
+        st_mode=os.stat('testfile').st_mode, st_size=0, st_blksize=4096)
+    with patch('sys.version_info', (3, 10)), \
+         patch('os.fstat', return_value=fake_stat):
+        assert userprovided.hashing.calculate_file_hash(pathlib.Path('testfile')) == testfile_sha256
+        assert userprovided.hashing.calculate_file_hashes('testfile', ['sha224', 'sha512']) == {
+            'sha224': testfile_sha224,
+            'sha512': testfile_sha512}
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="requires named pipes")
+def test_calculate_file_hash_fifo(tmp_path):
+    fifo = tmp_path / 'fifo'
+    os.mkfifo(fifo)
+    content = pathlib.Path('testfile').read_bytes()
+
+    def write_to_fifo():
+        with open(fifo, 'wb') as writer:
+            writer.write(content)
+
+    writer_thread = threading.Thread(target=write_to_fifo)
+    writer_thread.start()
+    with patch('sys.version_info', (3, 10)):
+        assert userprovided.hashing.calculate_file_hash(fifo) == testfile_sha256
+    writer_thread.join()
+
+
 # mock a PermissionError exception
 # see: https://stackoverflow.com/questions/1289894/#answer-34677735
 def test_calculate_file_hash_mocked_permission():
@@ -133,10 +225,22 @@ def test_hypothesis_mail_is_email(x):
     ('iekoh#xeeseizo', False),
     ('ab$$c', False),
     ('ABc', False),
+    ('abcä', False),
     # bucket name must start with lowercase letter or number:
     ('-abc', False),
     # containing dots:
-    ('iekoht9choofe.eixeeseizoo0iuzos1ibee.pae7ph', True)
+    ('iekoht9choofe.eixeeseizoo0iuzos1ibee.pae7ph', True),
+    # labels with one character:
+    ('ab.c', True),
+    ('abc.d', True),
+    ('a1.b.cde', True),
+    ('my-bucket.x', True),
+    # labels must end with a lowercase letter or number:
+    ('abc-', False),
+    ('abc.', False),
+    ('abc-.def', False),
+    # adjacent labels are separated by a single period:
+    ('abc..def', False)
 ])
 def test_cloud_is_aws_s3_bucket_name(bucket_name, truth_value):
     assert userprovided.parameters.is_aws_s3_bucket_name(bucket_name) is truth_value
@@ -153,10 +257,32 @@ def test_is_url():
     assert userprovided.url.is_url('https://example.com') is True
     assert userprovided.url.is_url('https://example.com', ('https', 'http')) is True
     assert userprovided.url.is_url('https://example.com', ('https')) is True
+    # lists are not hashable, so the result is not cached:
+    assert userprovided.url.is_url('https://example.com', ['https']) is True
+    assert userprovided.url.is_url('ftp://example.com', ['https']) is False
+    # a tuple with an unhashable element cannot be cached:
+    assert userprovided.url.is_url('https://example.com', (['https'], )) is False
+    # Input that is no string is handled by urlsplit as before:
+    assert userprovided.url.is_url(b'https://example.com') == userprovided.url._is_url_split(urllib.parse.urlsplit(b'https://example.com'))
+    assert userprovided.url.is_url(None) == userprovided.url._is_url_split(urllib.parse.urlsplit(None))
     assert userprovided.url.is_url('https://subdomain.example.com') is True
     assert userprovided.url.is_url('https://example.com/index.php?id=42') is True
 
 
+@pytest.mark.parametrize("test_url", [
+    'https://example.com', 'HTTPS://Example.com/', 'ftp://example.com',
+    'https://user:pw@example.com:8080/?a=1#b', 'https://example.com#a',
+    'https:/example.com', 'https://', 'https:///path', 'noscheme.example.com',
+    '1http://example.com', 'https://exämple.com', 'https://[::1]/',
+    'https://ex ample.com', ' https://example.com', 'https://exa\tmple.com'
+])
+def test_is_url_fast_path(test_url):
+    # The regular expression must agree with urlsplit:
+    for schemes in (None, ('https', 'http')):
+        assert (userprovided.url._is_url_unsplit(test_url, schemes) ==
+                userprovided.url._is_url_split(urllib.parse.urlsplit(test_url), schemes))
+
+
 def test_normalize_query_part():
     # By mistake a full URL is provided instead of only the query part:
     with pytest.raises(ValueError):
@@ -169,10 +295,17 @@ def test_normalize_query_part():
     # Chunk of query is malformed: the = is missing:
     assert userprovided.url.normalize_query_part('missingequalsign&foo=bar') == 'foo=bar'
     assert userprovided.url.normalize_query_part('foo=bar&missingequalsign&') == 'foo=bar'
+    # only the part up to a second equal sign is kept:
+    assert userprovided.url.normalize_query_part('foo=1=2&bar==3') == 'foo=1'
+    # percent-encoding is not changed:
+    assert userprovided.url.normalize_query_part('q=a%20b+c&a=%26') == 'a=%26&q=a%20b+c'
     # Drop specific key (with tuple, list and set):
     assert userprovided.url.normalize_query_part('foo=1&bar=2&', drop_keys=('bar')) == 'foo=1'
     assert userprovided.url.normalize_query_part('foo=1&bar=2&', drop_keys=['bar']) == 'foo=1'
     assert userprovided.url.normalize_query_part('foo=1&bar=2&', drop_keys={'bar'}) == 'foo=1'
+    assert userprovided.url.normalize_query_part('foo=1&bar=2&', drop_keys=frozenset({'bar'})) == 'foo=1'
+    # a single string is one key, not a collection of substrings:
+    assert userprovided.url.normalize_query_part('a=1&bar=2', drop_keys='bar') == 'a=1'
     # Try to drop non-existent key:
     assert userprovided.url.normalize_query_part('foo=1&bar=2&', drop_keys=['not_in_url']) == 'bar=2&foo=1'
     # drop_key is set, but empty or None:
@@ -197,6 +330,12 @@ def test_normalize_query_part():
     # Remove duplicate slashes from the path (2)
     ('https://www.example.com/en//index.html',
      'https://www.example.com/en/index.html'),
+    # Remove duplicate slashes from the path (3)
+    ('https://www.example.com/en///index.html',
+     'https://www.example.com/en/index.html'),
+    # Remove duplicate slashes from the path (4)
+    ('https://www.example.com/en////index.html',
+     'https://www.example.com/en/index.html'),
     # remove fragment when query is not present
     (' https://www.example.com/index.html#test ',
      'https://www.example.com/index.html'),
@@ -219,6 +358,14 @@ def test_normalize_query_part():
     # However still used by some software.
     ('https://www.example.com/forums/forumdisplay.php?example-forum',
      'https://www.example.com/forums/forumdisplay.php?example-forum'),
+    # Empty parameters of the last path segment are removed, others kept:
+    ('https://www.example.com/index.php;', 'https://www.example.com/index.php'),
+    ('https://www.example.com/index.php;?a=1',
+     'https://www.example.com/index.php?a=1'),
+    ('https://www.example.com/index.php;a=1',
+     'https://www.example.com/index.php;a=1'),
+    ('https://www.example.com/a;/index.php',
+     'https://www.example.com/a;/index.php'),
     # Empty query, but '?' indicating one
     ('https://www.example.com/index.php?', 'https://www.example.com/index.php')
 ])
@@ -226,6 +373,38 @@ def test_normalize_url(test_url, normalized_url):
     assert userprovided.url.normalize_url(test_url) == normalized_url
 
 
+@pytest.mark.parametrize("test_url", [
+    'https://www.example.com',
+    'https://www.example.com/',
+    'http://www.example.com/en/index.html',
+    'https://www.example.com/index.php?name=foo',
+    'https://www.example.com/index.py?a=1&b=2&c=3',
+    'https://www.example.com/forums/forumdisplay.php?example-forum',
+    # not canonical:
+    'https://www.example.com/index.py?b=1&a=2',
+    'https://www.example.com/index.py?a=1&a=1',
+    'https://www.example.com/index.py?a=1=2',
+    'https://www.example.com/index.py?a=1&&b=2',
+    'https://www.example.com/index.py?a=',
+    'https://www.example.com/index.py?=1',
+    'https://www.example.com/?',
+    'https://www.example.com/#',
+    'https://www.example.com//index.html',
+    'https://www.example.com:443/',
+    'https://www.example.com:8080/',
+    'https://WWW.example.com/',
+    # query part that looks like an URL:
+    'https://www.example.com/?http://a=1',
+    'https://www.example.com/?http://example.com',
+])
+def test_normalize_url_fast_path(test_url):
+    # An irrelevant key to drop forces the full normalization:
+    expected = userprovided.url.normalize_url(test_url, ['unused'])
+    assert userprovided.url.normalize_url(test_url) == expected
+    if userprovided.url._is_canonical_url(test_url):
+        assert test_url == expected
+
+
 def test_normalize_url_exceptions():
     # input is not an URL
     with pytest.raises(ValueError):
@@ -255,6 +434,47 @@ def test_normalize_url_unchanged_query():
     ) == 'https://www.example.com/index.php?foo=1&foo=2'
 
 
+def test_normalize_urls():
+    urls = ['HTTPS://www.example.com:443//index.py?c=3&a=1&b=2&d=',
+            'https://www.example.com/']
+    expected = ['https://www.example.com/index.py?a=1&b=2&c=3',
+                'https://www.example.com/']
+    assert list(userprovided.url.normalize_urls(urls)) == expected
+    assert list(userprovided.url.normalize_urls(urls, workers=2)) == expected
+    assert list(userprovided.url.normalize_urls(urls, drop_keys=['c'])) == [
+        'https://www.example.com/index.py?a=1&b=2', 'https://www.example.com/']
+    # parameters are checked before the first URL:
+    with pytest.raises(userprovided.err.ContradictoryParameters):
+        userprovided.url.normalize_urls(urls, ['a'], do_not_change_query_part=True)
+    with pytest.raises(ValueError):
+        userprovided.url.normalize_urls(urls, workers=0)
+    # Errors are raised at the position of the URL in both modes:
+    for workers in (1, 2):
+        results = userprovided.url.normalize_urls(
+            urls + ['somestring'], workers=workers)
+        assert next(results) == expected[0]
+        assert next(results) == expected[1]
+        with pytest.raises(ValueError):
+            next(results)
+    with pytest.raises(userprovided.err.QueryKeyConflict):
+        list(userprovided.url.normalize_urls(
+            ['https://www.example.com/?a=1&a=2'], workers=2))
+
+
+def test_canonical_key():
+    key = userprovided.url.canonical_key('https://www.example.com/?a=1&b=2')
+    assert isinstance(key, int)
+    assert 0 <= key < 2**64
+    # same normalized URL:
+    assert userprovided.url.canonical_key(' HTTPS://www.Example.com:443//?b=2&a=1#foo ') == key
+    assert userprovided.url.canonical_key('https://www.example.com/?a=1&b=2&c=3', ['c']) == key
+    # different URLs:
+    assert userprovided.url.canonical_key('https://www.example.com/?a=1') != key
+    assert userprovided.url.canonical_key('http://www.example.com/?a=1&b=2') != key
+    with pytest.raises(ValueError):
+        userprovided.url.canonical_key('somestring')
+
+
 def test_determine_file_extension():
     # URL hint matches server header
     assert userprovided.url.determine_file_extension('https://www.example.com/example.pdf', 'application/pdf') == '.pdf'
@@ -281,13 +501,48 @@ def test_determine_file_extension():
 # There are some edge cases in which `mimetypes.guess_extension`
 # (in the python standard library) has different return values
 # depending on the Python version used.
+@pytest.mark.parametrize("path", [
+    '/index.html', '/a/b.htm', '/a.b.jpg', '/a..png', '/.html', '/..html',
+    '/a/.pdf', '/x.json', '/x.PDF', '/x.js', '/x.html.gz', '/x.html/', '/x.txt;p=1',
+    '/x.css', '/x.zip', '/x.gif', '/x.jpeg', '/x.txt'
+])
+def test_guess_type_common_types(path):
+    # The shortcut for common types must agree with mimetypes:
+    assert userprovided.url._guess_type(path) == mimetypes.guess_type(path)[0]
+
+
+@pytest.mark.parametrize("test_url,mime_type,extension", [
+    ('https://example.com/file.pdf;jsessionid=1', None, '.pdf'),
+    ('https://example.com/file.pdf;jsessionid=1', 'text/plain', '.pdf'),
+    ('https://example.com/a.html;x', 'application/pdf', '.html'),
+    ('https://example.com/dir;x/a.txt', None, '.txt'),
+    ('ftp://example.com/a.pdf;type=i', None, '.pdf')
+])
+def test_determine_file_extension_params(test_url, mime_type, extension):
+    # Parameters after the last path segment must not hide the extension:
+    assert userprovided.url.determine_file_extension(test_url, mime_type) == extension
+
+
 def test_determine_file_extension_version_inconsistencies():
-    with patch('mimetypes.guess_extension', return_value='.bat'):
+    def clear_caches():
+        # determine_file_extension caches its results and the lookups:
+        userprovided.url.determine_file_extension.cache_clear()
+        userprovided.url._guess_extension.cache_clear()
+    # The table of common mime types is emptied, so that the patched
+    # mimetypes.guess_extension is actually called.
+    clear_caches()
+    with patch('mimetypes.guess_extension', return_value='.bat'), \
+         patch.dict('userprovided.url._COMMON_EXTENSIONS', clear=True):
         assert userprovided.url.determine_file_extension('https://www.example.com/test.txt', 'text/plain') == '.txt'
-    with patch('mimetypes.guess_extension', return_value='.htm'):
+    clear_caches()
+    with patch('mimetypes.guess_extension', return_value='.htm'), \
+         patch.dict('userprovided.url._COMMON_EXTENSIONS', clear=True):
         assert userprovided.url.determine_file_extension('https://www.example.com/test.htm', 'text/plain') == '.html'
-    with patch('mimetypes.guess_extension', return_value=None):
+    clear_caches()
+    with patch('mimetypes.guess_extension', return_value=None), \
+         patch.dict('userprovided.url._COMMON_EXTENSIONS', clear=True):
         assert userprovided.url.determine_file_extension('https://www.example.com/test.htm', 'text/plain') == '.unknown'
+    clear_caches()
 
 
 def test_date_exists_non_numeric():
@@ -303,6 +558,25 @@ def test_date_exists(x):
     assert userprovided.date.date_exists(x.year, x.month, x.day) is True
 
 
+@pytest.mark.parametrize("year,month,day,truth_value", [
+    # leap years:
+    (2020, 2, 29, True),
+    (2000, 2, 29, True),
+    (1900, 2, 29, False),
+    (2021, 2, 29, False),
+    # month or day out of range:
+    (2021, 4, 31, False),
+    (2021, 13, 1, False),
+    (2021, 0, 1, False),
+    (2021, 1, 0, False),
+    # outside the range of the datetime module:
+    (0, 1, 1, False),
+    (10000, 1, 1, False)
+])
+def test_date_exists_invalid_dates(year, month, day, truth_value):
+    assert userprovided.date.date_exists(year, month, day) is truth_value
+
+
 @pytest.mark.parametrize("date_string,expected", [
     # valid input:
     ('Jul. 4, 1776', '1776-07-04'),
@@ -382,6 +656,9 @@ def test_date_de_long_to_iso_exceptions():
 
 def test_parameters_is_port():
     assert userprovided.parameters.is_port(443) is True
+    # limits of the range:
+    assert userprovided.parameters.is_port(0) is True
+    assert userprovided.parameters.is_port(65535) is True
     assert userprovided.parameters.is_port(65536) is False
     assert userprovided.parameters.is_port(-1) is False
     with pytest.raises(ValueError):
@@ -428,6 +705,16 @@ def test_validate_dict_keys():
             {'a': 1, 'b': 2},
             {'a', 'b', 'c'},
             {'b', 'c'})
+    # the reported key does not depend on the order of sets:
+    with pytest.raises(ValueError, match='Unknown key d in'):
+        userprovided.parameters.validate_dict_keys(
+            {'a': 1, 'd': 2, 'e': 3, 'f': 4},
+            {'a', 'b'})
+    with pytest.raises(ValueError, match='Necessary key c missing'):
+        userprovided.parameters.validate_dict_keys(
+            {'a': 1},
+            {'a', 'b', 'c', 'd', 'e'},
+            {'e', 'd', 'c'})
     # necessary_keys contains a key missing in allowed_keys
     with pytest.raises(ValueError):
         userprovided.parameters.validate_dict_keys(
@@ -10,9 +10,91 @@ Released under the Apache License 2.0
 """
 
 
+import calendar
 import datetime
+import functools
 import logging
 import re
+from typing import Optional, Tuple
+
+
+# Compiled once at import. Positional groups avoid the groupdict lookups
+# named groups need: (month) (day) (year) / (day) (month) (year)
+# Only the bound search methods are kept, which saves the attribute
+# lookup on every call.
+_search_en_long = re.compile(
+    r"([a-zA-Z\.]{3,9})\s+(\d{1,2})(?:th)?,\s*(\d\d\d\d)").search
+_search_de_long = re.compile(
+    r"(\d{1,2})\.\s+([a-zA-Z\.]{3,9})\s+(\d\d\d\d)").search
+
+
+# Days per month in a common year. February is corrected for leap years.
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _with_case_variants(months: dict) -> dict:
+    """Add the lower and upper case spelling of every month name, so the
+       common spellings are found without transforming the input."""
+    variants = dict()
+    for name, number in months.items():
+        variants[name] = number
+        variants[name.lower()] = number
+        variants[name.upper()] = number
+    return variants
+
+
+_EN_MONTHS = _with_case_variants({
+    'January': '01', 'Jan.': '01',
+    'February': '02', 'Feb.': '02',
+    'March': '03', 'Mar.': '03',
+    'April': '04', 'Apr.': '04',
+    'May': '05',
+    'June': '06', 'Jun.': '06',
+    'July': '07', 'Jul.': '07',
+    'August': '08', 'Aug.': '08',
+    'September': '09', 'Sep.': '09',
+    'October': '10', 'Oct.': '10',
+    'November': '11', 'Nov.': '11',
+    'December': '12', 'Dec.': '12'
+    })
+
+_DE_MONTHS = _with_case_variants({
+    'Januar': '01', 'Jan.': '01',
+    'Februar': '02', 'Feb.': '02',
+    'März': '03', 'Mar.': '03',
+    'April': '04', 'Apr.': '04',
+    'Mai': '05',
+    'Juni': '06', 'Jun.': '06',
+    'Juli': '07', 'Jul.': '07',
+    'August': '08', 'Aug.': '08',
+    'September': '09', 'Sep.': '09',
+    'Oktober': '10', 'Okt.': '10',
+    'November': '11', 'Nov.': '11',
+    'Dezember': '12', 'Dez.': '12'
+    })
+
+
+def _lookup_month(months: dict, month_name: str) -> str:
+    """Return the two digit number of a month name. Raises KeyError if the
+       name is unknown."""
+    # Fall back to the lower-cased name for mixed case like 'jUlI':
+    number = months.get(month_name) or months.get(month_name.lower())
+    if number is None:
+        raise KeyError(f"Do not recognize month '{month_name}'.")
+    return number
+
+
+def _split_en_long_date(date_string: str) -> Optional[Tuple[str, str, str]]:
+    """Fast path for the common shape 'Month D, YYYY' (like 'Jul. 4, 1776'
+       or 'November 03, 2020') that avoids the regular expression.
+       Returns (month, day, year) or None if the string has another shape."""
+    month, _, rest = date_string.partition(' ')
+    day, comma, year = rest.partition(', ')
+    if (comma and month in _EN_MONTHS and
+            0 < len(day) < 3 and day.isdecimal() and
+            len(year) == 4 and year.isdecimal()):
+        return month, day, year
+    return None
 
 
 def date_exists(year: int,
@@ -29,56 +111,44 @@ def date_exists(year: int,
         logging.error('Could not convert date parts to integer.')
         return False
 
-    try:
-        datetime.datetime(year, month, day)
-    except ValueError:
-        logging.error('Provided date does not exist in the calendar.')
-        return False
-    return True
+    # Plain arithmetic instead of constructing a datetime object and
+    # catching the ValueError. Same limits as the datetime module.
+    if (datetime.MINYEAR <= year <= datetime.MAXYEAR and
+            1 <= month <= 12 and day >= 1):
+        days_in_month = _DAYS_IN_MONTH[month - 1]
+        if month == 2 and calendar.isleap(year):
+            days_in_month = 29
+        if day <= days_in_month:
+            return True
+    logging.error('Provided date does not exist in the calendar.')
+    return False
 
 
+@functools.lru_cache(maxsize=4096)
 def date_en_long_to_iso(date_string: str) -> str:
     """ Take a long format English date and return a standardized date string
-       (i.e. YYYY-MM-DD). """
+       (i.e. YYYY-MM-DD).
+       Results are cached (up to 4096 distinct strings) as the same dates
+       tend to occur many times. Call date_en_long_to_iso.cache_clear() to
+       free that memory in long running processes."""
     date_string = date_string.strip()
-    regex_long_date_en = re.compile(
-        r"(?P<monthL>[a-zA-Z\.]{3,9})\s+(?P<day>\d{1,2})(th)?,\s*(?P<year>\d\d\d\d)")
-    try:
-        match = re.search(regex_long_date_en, date_string)
-        if match:
-            match_year = match.group('year')
-            match_month = match.group('monthL')
-            match_day = match.group('day')
-        else:
+    parts = _split_en_long_date(date_string)
+    if parts is None:
+        # Unusual shape: fall back to the regular expression
+        match = _search_en_long(date_string)
+        if match is None:
+            logging.error('Malformed date')
             raise AttributeError('No date provided')
-    except AttributeError:
-        logging.error('Malformed date')
-        raise
+        match_month, match_day, match_year = match.group(1, 2, 3)
+    else:
+        match_month, match_day, match_year = parts
 
     # add a zero to day if <10
     if len(match_day) == 1:
         match_day = '0' + match_day
-    months = {
-        'January': '01', 'Jan.': '01',
-        'February': '02', 'Feb.': '02',
-        'March': '03', 'Mar.': '03',
-        'April': '04', 'Apr.': '04',
-        'May': '05',
-        'June': '06', 'Jun.': '06',
-        'July': '07', 'Jul.': '07',
-        'August': '08', 'Aug.': '08',
-        'September': '09', 'Sep.': '09',
-        'October': '10', 'Oct.': '10',
-        'November': '11', 'Nov.': '11',
-        'December': '12', 'Dec.': '12'
-        }
-    try:
-        match_month = months[str(match_month).lower().capitalize()]
-    except KeyError:
-        # String for month matched the regular expression but is no
-        # recognized month.
-        logging.error('Do not recognize month.')
-        raise
+    # Raises KeyError if the string matched the regular expression,
+    # but is no recognized month:
+    match_month = _lookup_month(_EN_MONTHS, match_month)
 
     if not date_exists(int(match_year), int(match_month), int(match_day)):
         raise ValueError('Provided date is invalid.')
@@ -86,48 +156,25 @@ def date_en_long_to_iso(date_string: str) -> str:
     return f"{match_year}-{match_month}-{match_day}"
 
 
+@functools.lru_cache(maxsize=4096)
 def date_de_long_to_iso(date_string: str) -> str:
     """Take a long format German date and return a standardized date string
-       (i.e. YYYY-MM-DD). """
+       (i.e. YYYY-MM-DD).
+       Results are cached (up to 4096 distinct strings). Call
+       date_de_long_to_iso.cache_clear() to free that memory."""
     date_string = date_string.strip()
-    regex_long_date_de = re.compile(
-        r"(?P<day>\d{1,2})\.\s+(?P<monthL>[a-zA-Z\.]{3,9})\s+(?P<year>\d\d\d\d)")
-    try:
-        match = re.search(regex_long_date_de, date_string)
-        if match:
-            match_year = match.group('year')
-            match_month = match.group('monthL')
-            match_day = match.group('day')
-        else:
-            raise AttributeError('No date provided')
-    except AttributeError:
-        logging.exception('Malformed date')
-        raise
+    match = _search_de_long(date_string)
+    if match is None:
+        logging.error('Malformed date')
+        raise AttributeError('No date provided')
+    match_day, match_month, match_year = match.group(1, 2, 3)
 
     # add a zero to day if <10
     if len(match_day) == 1:
         match_day = '0' + match_day
-    months = {
-        'Januar': '01', 'Jan.': '01',
-        'Februar': '02', 'Feb.': '02',
-        'März': '03', 'Mar.': '03',
-        'April': '04', 'Apr.': '04',
-        'Mai': '05',
-        'Juni': '06', 'Jun.': '06',
-        'Juli': '07', 'Jul.': '07',
-        'August': '08', 'Aug.': '08',
-        'September': '09', 'Sep.': '09',
-        'Oktober': '10', 'Okt.': '10',
-        'November': '11', 'Nov.': '11',
-        'Dezember': '12', 'Dez.': '12'
-        }
-    try:
-        match_month = months[str(match_month).lower().capitalize()]
-    except KeyError:
-        # String for month matched the regular expression but is no
-        # recognized month.
-        logging.exception('Do not recognize month.')
-        raise
+    # Raises KeyError if the string matched the regular expression,
+    # but is no recognized month:
+    match_month = _lookup_month(_DE_MONTHS, match_month)
 
     if not date_exists(int(match_year), int(match_month), int(match_day)):
         raise ValueError('Provided date is invalid.')
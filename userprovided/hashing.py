@@ -11,12 +11,26 @@ Released under the Apache License 2.0
 
 
 import hashlib
+import hmac
+import io
 import logging
+import os
 import pathlib
-from typing import Optional, Union
+import sys
+from typing import Dict, Iterable, List, Optional, Union
 
 from userprovided import err
 
+# Snapshot of the algorithms hashlib offers. Taken once at import, as
+# the set of available OpenSSL algorithms does not change at runtime.
+_ALGORITHMS_AVAILABLE = frozenset(hashlib.algorithms_available)
+# Hash methods that are rejected because they are deprecated:
+_DEPRECATED = frozenset({'md5', 'sha1'})
+# Hash methods calculate_file_hash supports:
+_SUPPORTED = frozenset({'sha224', 'sha256', 'sha512'})
+# Minimum chunk size if a file cannot be memory mapped:
+_CHUNK_SIZE = 1 << 20
+
 
 def hash_available(hash_method: str,
                    fail_on_deprecated: bool = True) -> bool:
@@ -30,55 +44,81 @@ def hash_available(hash_method: str,
     if hash_method == '' or hash_method is None:
         raise ValueError('No hash method provided')
 
-    # Is the chosen method available and supported?
-    hash_method = hash_method.strip()
-
     if fail_on_deprecated:
-        if hash_method in ('md5', 'sha1'):
-            raise err.DeprecatedHashAlgorithm('The supplied hash method %s is deprecated!')
+        if hash_method in _DEPRECATED:
+            raise err.DeprecatedHashAlgorithm(
+                f"The supplied hash method {hash_method} is deprecated!")
 
-    if hash_method in hashlib.algorithms_available:
-        logging.debug('Hash method %s is available.', hash_method)
-        return True
-    return False
+    # Is the chosen method available?
+    return hash_method in _ALGORITHMS_AVAILABLE
 
 
-def calculate_file_hash(file_path: Union[pathlib.Path, str],
-                        hash_method: str = 'sha256',
-                        expected_hash: Optional[str] = None) -> str:
-    """Calculate hash value for a file.
-       Supported: SHA224 / SHA256 / SHA512
-       If you provide expected_hash this will raise a ValueError exception
-       in case this does not match the calculated hash. This allows you to
-       detect changes or tampering."""
-
-    if hash_method in ('md5', 'sha1'):
+def _new_hash(hash_method: str) -> 'hashlib._Hash':
+    """Return a new hash object for one of the supported hash methods.
+       Raises DeprecatedHashAlgorithm or ValueError otherwise."""
+    if hash_method in _DEPRECATED:
         raise err.DeprecatedHashAlgorithm(
             'Deprecated hash method not supported')
 
     if hash_available(hash_method):
-        if hash_method == 'sha224':
-            h = hashlib.sha224()
-        elif hash_method == 'sha256':
-            h = hashlib.sha256()
-        elif hash_method == 'sha512':
-            h = hashlib.sha512()
-        else:
+        if hash_method not in _SUPPORTED:
             raise ValueError('Hash method not supported')
+        # Safe: only names from _SUPPORTED reach this point.
+        return hashlib.new(hash_method)
+    raise ValueError(f"Hash method {hash_method} not available on system.")
+
+
+def _update_from_file(hashes: List['hashlib._Hash'],
+                      file: io.BufferedReader) -> None:
+    """Feed the content of an open binary file into all hash objects."""
+    if len(hashes) == 1 and sys.version_info >= (3, 11):
+        # file_digest runs the read / update loop in C with a reused
+        # buffer and without holding the GIL.
+        h = hashes[0]
+        hashlib.file_digest(file, lambda: h)
     else:
-        raise ValueError(f"Hash method {hash_method} not available on system.")
+        _update_in_chunks(hashes, file)
+
+
+def _update_in_chunks(hashes: List['hashlib._Hash'],
+                      file: io.BufferedReader) -> None:
+    """Feed the content of an open binary file into all hash objects.
+       The chunks are read into one reused buffer. Memory mapping is not
+       used: if another process truncates a mapped file, the process is
+       killed with SIGBUS instead of getting an exception."""
+    file_descriptor = file.fileno()
+    if hasattr(os, 'posix_fadvise'):
+        # Let the kernel prefetch pages as the file is read sequentially.
+        # Only a hint: pipes for example do not support it.
+        try:
+            os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+    # st_blksize does not exist on Windows.
+    file_stat = os.fstat(file_descriptor)
+    buffer = bytearray(max(getattr(file_stat, 'st_blksize', 0), _CHUNK_SIZE))
+    view = memoryview(buffer)
+    size = file.readinto(buffer)
+    while size:
+        for h in hashes:
+            h.update(view[:size])
+        size = file.readinto(buffer)
+
+
+def calculate_file_hashes(file_path: Union[pathlib.Path, str],
+                          hash_methods: Iterable[str]) -> Dict[str, str]:
+    """Calculate multiple hash values for a file, but read it only once.
+       Supported: SHA224 / SHA256 / SHA512
+       Returns a dictionary with the hash method as key and the hash as
+       value."""
+
+    hashes = {method: _new_hash(method) for method in hash_methods}
+    if not hashes:
+        raise ValueError('No hash method provided')
 
     try:
         with open(pathlib.Path(file_path), 'rb') as file:
-            content = file.read()
-        h.update(content)
-        calculated_hash = h.hexdigest()
-        if expected_hash and expected_hash != calculated_hash:
-            mismatch_message = ("Mismatch between calculated and expected " +
-                                f"{hash_method} hash for {file_path}")
-            logging.exception(mismatch_message)
-            raise ValueError(mismatch_message)
-        return calculated_hash
+            _update_from_file(list(hashes.values()), file)
     except FileNotFoundError:
         logging.exception(
             'Cannot calculate hash: File not found or not readable.',
@@ -93,3 +133,35 @@ def calculate_file_hash(file_path: Union[pathlib.Path, str],
         logging.error('Exception while trying to get file hash',
                       exc_info=True)
         raise
+    return {method: h.hexdigest() for method, h in hashes.items()}
+
+
+def _hashes_match(expected_hash: str, calculated_hash: str) -> bool:
+    """Compare in constant time. Hex digests may come in upper case.
+       User input that is no ASCII string cannot match."""
+    if not isinstance(expected_hash, str):
+        return False
+    try:
+        return hmac.compare_digest(expected_hash.lower(), calculated_hash)
+    except TypeError:
+        # compare_digest does not support non-ASCII characters in strings
+        return False
+
+
+def calculate_file_hash(file_path: Union[pathlib.Path, str],
+                        hash_method: str = 'sha256',
+                        expected_hash: Optional[str] = None) -> str:
+    """Calculate hash value for a file.
+       Supported: SHA224 / SHA256 / SHA512
+       If you provide expected_hash this will raise a ValueError exception
+       in case this does not match the calculated hash. This allows you to
+       detect changes or tampering."""
+
+    calculated_hash = calculate_file_hashes(
+        file_path, [hash_method])[hash_method]
+    if expected_hash and not _hashes_match(expected_hash, calculated_hash):
+        mismatch_message = ("Mismatch between calculated and expected " +
+                            f"{hash_method} hash for {file_path}")
+        logging.error(mismatch_message)
+        raise ValueError(mismatch_message)
+    return calculated_hash
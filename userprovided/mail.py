@@ -14,6 +14,13 @@ import logging
 import re
 
 
+# Compiled once at import. match() anchors at the start. The lazy domain
+# part stops at the first dot followed by a letter, and nothing after
+# that letter is inspected as it cannot change the result.
+_EMAIL_PATTERN = re.compile(r"[^\s@]+@[^\s@]+?\.[a-zA-Z]")
+_email_match = _EMAIL_PATTERN.match
+
+
 def is_email(mailaddress: str) -> bool:
     "Very basic check if the email address has a valid format."
 
@@ -22,7 +29,10 @@ def is_email(mailaddress: str) -> bool:
         return False
 
     mailaddress = mailaddress.strip()
-    if not re.match(r"^[^\s@]+@[^\s@]+\.[a-zA-Z]+", mailaddress):
+    # Cheap rejects before the regular expression. The shortest match
+    # is like 'a@b.c'.
+    if (len(mailaddress) < 5 or '@' not in mailaddress or
+            not _email_match(mailaddress)):
         logging.error(
             'The supplied mailaddress %s has an unknown format.', mailaddress)
         return False
@@ -11,15 +11,39 @@ Released under the Apache License 2.0
 
 import logging
 import re
-from typing import Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 
 from userprovided import err
 
+# convert_to_set: conversion by exact type of the argument
+_SET_CONVERTERS: Dict[type, Callable[[Any], set]] = {
+    set: lambda convert_this: convert_this,
+    str: lambda convert_this: {convert_this},
+    list: set,
+    tuple: set}
+
+# Characters allowed in AWS S3 bucket names:
+_S3_ALLOWED_BYTES = b'abcdefghijklmnopqrstuvwxyz0123456789-.'
+# Patterns for is_aws_s3_bucket_name, compiled once at import:
+_s3_ip_match = re.compile(
+    r"[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}").match
+# The labels pattern has to cover the whole name. With a prefix match
+# names like 'abc-' or 'abc..def' passed. Labels can be a single character.
+_s3_labels_match = re.compile(
+    r"[a-z0-9](?:[a-z0-9\-]*[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9\-]*[a-z0-9])?)*"
+    ).fullmatch
+
 
 def convert_to_set(convert_this: Union[list, set, str, tuple]) -> set:
     """ Convert a string, a tuple, or a list into a set
         (i.e. no duplicates, unordered)"""
 
+    # Exact types need a single dict lookup instead of the isinstance chain:
+    converter = _SET_CONVERTERS.get(type(convert_this))
+    if converter is not None:
+        return converter(convert_this)
+
+    # subclasses of the supported types:
     if isinstance(convert_this, set):
         # functions using this expect a set, so everything
         # else just captures bad input by users
@@ -73,26 +97,39 @@ def validate_dict_keys(dict_to_check: dict,
         raise AttributeError('Expected a dictionary for the dict_to_check ' +
                              'parameter!') from no_dict
 
-    # Check for unknown keys:
-    for key in found_keys:
-        if key not in allowed_keys:
-            msg = f"Unknown key {key} in {dict_name}"
-            logging.exception(msg)
-            raise ValueError(msg)
+    # Check for unknown keys (the set difference runs in C):
+    unknown_keys = found_keys - allowed_keys
+    if unknown_keys:
+        # Report the first unknown key in the order of the dictionary:
+        unknown_key = next(k for k in found_keys if k in unknown_keys)
+        msg = f"Unknown key {unknown_key} in {dict_name}"
+        logging.exception(msg)
+        raise ValueError(msg)
     logging.debug('No unknown keys found.')
 
     # Check if all necessary keys are present:
     if necessary_keys:
-        for key in necessary_keys:
-            if key not in found_keys:
-                msg = f"Necessary key {key} missing in {dict_name}!"
-                logging.exception(msg)
-                raise ValueError(msg)
+        missing_keys = necessary_keys.difference(found_keys)
+        if missing_keys:
+            # The order of a set changes between runs, so report
+            # the same key each time:
+            missing_key = min(missing_keys, key=str)
+            msg = f"Necessary key {missing_key} missing in {dict_name}!"
+            logging.exception(msg)
+            raise ValueError(msg)
         logging.debug('All necessary keys found.')
 
     return True
 
 
+def _is_none_or_empty(value: object) -> bool:
+    """True if value is None, a whitespace-only string, or an empty
+       dict/list/set/tuple."""
+    return (value is None or
+            (isinstance(value, str) and not value.strip()) or
+            (isinstance(value, (dict, list, set, tuple)) and not value))
+
+
 def keys_neither_none_nor_empty(dict_to_check: dict) -> bool:
     """Checks if all keys in the provided dictionary are neither None, nor
        have an empty value (like an empty string (including whitespace only)
@@ -108,22 +145,9 @@ def keys_neither_none_nor_empty(dict_to_check: dict) -> bool:
     if len(dict_to_check) == 0:
         raise ValueError('This dictionary is empty')
 
-    def error_found() -> None:
+    if any(_is_none_or_empty(value) for value in dict_to_check.values()):
         logging.error("Dictionary contains key that is either empty or None!")
-
-    for _, value in dict_to_check.items():
-        if value is None:
-            error_found()
-            return False
-        if isinstance(value, str):
-            if len(value.strip()) == 0:
-                error_found()
-                return False
-        if isinstance(value, (dict, list, set, tuple)):
-            if len(value) == 0:
-                error_found()
-                return False
-
+        return False
     return True
 
 
@@ -135,12 +159,26 @@ def numeric_in_range(parameter_name: str,
                      ) -> Union[int, float]:
     """Checks if a numeric value is within a specified range.
        If not this returns the fallback value and logs a warning."""
-    if not parameter_name:
-        parameter_name = ''
-
-    for param in {given_value, minimum_value, maximum_value, fallback_value}:
+    for param in (given_value, minimum_value, maximum_value, fallback_value):
         if not isinstance(param, (int, float)):
             raise ValueError('Value must be numeric.')
+    return _numeric_in_range_unchecked(parameter_name,
+                                       given_value,
+                                       minimum_value,
+                                       maximum_value,
+                                       fallback_value)
+
+
+def _numeric_in_range_unchecked(parameter_name: str,
+                                given_value: Union[int, float],
+                                minimum_value: Union[int, float],
+                                maximum_value: Union[int, float],
+                                fallback_value: Union[int, float]
+                                ) -> Union[int, float]:
+    """numeric_in_range without the type checks, for callers that
+       already made sure all values are numeric."""
+    if not parameter_name:
+        parameter_name = ''
 
     if minimum_value > maximum_value:
         raise err.ContradictoryParameters(
@@ -151,15 +189,15 @@ def numeric_in_range(parameter_name: str,
             "Fallback value outside the allowed range.")
 
     if given_value < minimum_value:
-        msg = (f"Value of {parameter_name} is below the minimum allowed." +
-               f"Falling back to {fallback_value}.")
-        logging.warning(msg)
+        logging.warning(
+            "Value of %s is below the minimum allowed. Falling back to %s.",
+            parameter_name, fallback_value)
         return fallback_value
 
     if given_value > maximum_value:
-        msg = (f"Value of {parameter_name} is above the maximum allowed." +
-               f"Falling back to {fallback_value}.")
-        logging.warning(msg)
+        logging.warning(
+            "Value of %s is above the maximum allowed. Falling back to %s.",
+            parameter_name, fallback_value)
         return fallback_value
 
     # passed all checks:
@@ -173,14 +211,15 @@ def int_in_range(parameter_name: str,
                  fallback_value: int) -> int:
     """Special case of numeric_in_range: check if given integer is
        within a specified range of possible values."""
-    for param in {given_value, minimum_value, maximum_value, fallback_value}:
-        if type(param) != int:  # pylint: disable=unidiomatic-typecheck
+    for param in (given_value, minimum_value, maximum_value, fallback_value):
+        # exact type check: bool is a subclass of int, but not accepted
+        if param.__class__ is not int:
             raise ValueError('Value must be an integer.')
-    return int(numeric_in_range(parameter_name,
-                                given_value,
-                                minimum_value,
-                                maximum_value,
-                                fallback_value))
+    return int(_numeric_in_range_unchecked(parameter_name,
+                                           given_value,
+                                           minimum_value,
+                                           maximum_value,
+                                           fallback_value))
 
 
 def is_port(port_number: int) -> bool:
@@ -190,7 +229,7 @@ def is_port(port_number: int) -> bool:
     if not isinstance(port_number, int):
         raise ValueError('Port has to be an integer.')
 
-    if 0 < port_number < 65536:
+    if 0 <= port_number <= 65535:
         logging.debug('Port within range')
         return True
     logging.error('Port not within valid range from 0 to 65535')
@@ -237,17 +276,18 @@ def is_aws_s3_bucket_name(bucket_name: str) -> bool:
         logging.error(
             'The AWS bucket name exceeds the maximum length of 63 characters.')
         return False
-    if not re.match(r"^[a-z0-9\-\.]*$", bucket_name):
+    # Deleting all allowed characters must leave nothing. Non-ASCII
+    # characters are encoded as '?', which is not allowed.
+    if bucket_name.encode('ascii', 'replace').translate(None,
+                                                         _S3_ALLOWED_BYTES):
         logging.error('The AWS bucket name contains invalid characters.')
         return False
-    if re.match(r"[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}",
-                bucket_name):
+    if _s3_ip_match(bucket_name):
         # Check if the bucket name resembles an IPv4 address.
         # No need to check IPv6 as the colon is not an allowed character.
         logging.error('An AWS must not resemble an IP address.')
         return False
-    if re.match(r"([a-z0-9][a-z0-9\-]*[a-z0-9]\.)*[a-z0-9][a-z0-9\-]*[a-z0-9]",
-                bucket_name):
+    if _s3_labels_match(bucket_name):
         # Must start with a lowercase letter or number
         # Bucket names must be a series of one or more labels.
         # Adjacent labels are separated by a single period (.).
@@ -264,7 +304,7 @@ def is_aws_s3_bucket_name(bucket_name: str) -> bool:
 def enforce_boolean(parameter_value: bool,
                     parameter_name: Optional[str] = None) -> None:
     """Raise a ValueError if the parameter is not of type bool."""
-    if type(parameter_value) != bool:  # pylint: disable=unidiomatic-typecheck
+    if parameter_value.__class__ is not bool:
         parameter_name = 'parameter' if parameter_name else ''
         raise ValueError(f"Value of {parameter_name} must be boolean," +
                          "i.e True / False (without quotation marks).")
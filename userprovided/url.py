@@ -11,25 +11,109 @@ Released under the Apache License 2.0
 
 
 # python standard library:
+import concurrent.futures
+import functools
+import hashlib
 import logging
 import mimetypes
-from typing import Dict, Optional, Union
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 import urllib.parse
 
 from userprovided import err
 
 
+if sys.version_info >= (3, 11):
+    # urlsplit has its own lru_cache since Python 3.11.
+    _urlsplit = urllib.parse.urlsplit
+else:
+    @functools.lru_cache(maxsize=4096)
+    def _urlsplit(url: str) -> urllib.parse.SplitResult:
+        """urllib.parse.urlsplit with a cache shared by all functions in
+           this module. The result is a named tuple and thereby immutable.
+           Python 3.8 to 3.10 only cache the parts of 20 URLs."""
+        return urllib.parse.urlsplit(url)
+
+
 def is_url(url: str,
            require_specific_schemes: Union[tuple, None] = None) -> bool:
     """Very basic check if the URL fulfills basic conditions ("LGTM").
-       Will not try to connect."""
-    parsed = urllib.parse.urlparse(url)
+       Will not try to connect.
+       Results are cached, so the reason for rejecting an URL is only
+       logged the first time."""
+    if type(url) is str and (require_specific_schemes is None or
+                             type(require_specific_schemes) is str or
+                             _is_string_tuple(require_specific_schemes)):
+        return _is_url_cached(url, require_specific_schemes)
+    # Not cached: other containers of schemes (like a list) may not be
+    # hashable and other input is left to urlsplit.
+    return _is_url_unsplit(url, require_specific_schemes)
+
+
+def _is_string_tuple(schemes: object) -> bool:
+    "True for a tuple of strings, which can be hashed for the caches."
+    return (type(schemes) is tuple and
+            all(type(scheme) is str for scheme in schemes))
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_url_cached(url: str,
+                   require_specific_schemes: Union[tuple, None]) -> bool:
+    "Cached part of is_url. Crawlers tend to check the same URLs repeatedly."
+    return _is_url_unsplit(url, require_specific_schemes)
+
+
+# Scheme and a plain ASCII netloc. Anything else (like IPv6 addresses,
+# internationalized domain names or whitespace) is left to urlsplit.
+_url_start_match = re.compile(
+    r"([A-Za-z][A-Za-z0-9+.\-]*)://[A-Za-z0-9.:@%_~!$&'()*+,;=\-]+(?=[/?#]|\Z)"
+    ).match
+
+
+def _is_url_unsplit(url: str,
+                    require_specific_schemes: Union[tuple, None]) -> bool:
+    """The checks of is_url. A regular expression accepts common URLs
+       without the cost of urlsplit."""
+    if type(url) is not str:
+        # like bytes, which urlsplit accepts
+        return _is_url_split(urllib.parse.urlsplit(url),
+                             require_specific_schemes)
+    match = _url_start_match(url)
+    if match is None:
+        return _is_url_split(_urlsplit(url),
+                             require_specific_schemes)
+    if require_specific_schemes:
+        scheme = match.group(1).lower()
+        if scheme not in _scheme_set(require_specific_schemes):
+            logging.error('Scheme %s not supported.', scheme)
+            return False
+    return True
+
 
+def _scheme_set(schemes: tuple) -> Union[tuple, frozenset]:
+    "Return a frozenset with the schemes for constant time lookups."
+    if not _is_string_tuple(schemes):
+        # Keep the behavior for other containers (and strings).
+        return schemes
+    return _freeze_schemes(schemes)
+
+
+@functools.lru_cache(maxsize=32)
+def _freeze_schemes(schemes: tuple) -> frozenset:
+    "Callers usually pass the same few literal tuples to is_url."
+    return frozenset(schemes)
+
+
+def _is_url_split(parsed: urllib.parse.SplitResult,
+                  require_specific_schemes: Union[tuple, None] = None) -> bool:
+    """The checks of is_url on an already split URL. Allows callers that
+       need the parts anyway to parse the URL only once."""
     if parsed.scheme == '':
         logging.debug('The URL has no scheme (like http or https)')
         return False
     if require_specific_schemes:
-        if parsed.scheme not in require_specific_schemes:
+        if parsed.scheme not in _scheme_set(require_specific_schemes):
             logging.error('Scheme %s not supported.', parsed.scheme)
             return False
 
@@ -40,17 +124,41 @@ def is_url(url: str,
     return True
 
 
-def normalize_query_part(query: str,
-                         drop_keys: Union[list, tuple, set, None] = None) -> str:
+def _drop_keys_set(drop_keys: Union[list, tuple, set, frozenset, str, None]
+                   ) -> Optional[frozenset]:
+    """Convert drop_keys to a frozenset for constant time lookups.
+       A single string is treated as one key."""
+    if not drop_keys:
+        return None
+    if isinstance(drop_keys, str):
+        return frozenset((drop_keys, ))
+    # frozenset() returns a frozenset argument as it is:
+    return frozenset(drop_keys)
+
+
+def normalize_query_part(
+        query: str,
+        drop_keys: Union[list, tuple, set, frozenset, None] = None) -> str:
     """Normalize the query part (for example '?foo=1&example=2') of an URL:
        * Remove every chunk that has no value assigned.
        * Sort the remaining chunks alphabetically.
        * Do not change queries without key (old implementations).
         The optional drop_keys allows you to remove specific keys
         (for example trackers)."""
+    if not query:
+        return ''
+
     if is_url(query):
         raise ValueError('Provide only the query part to normalize_query_part')
 
+    return _normalize_query_part_unchecked(query, _drop_keys_set(drop_keys))
+
+
+def _normalize_query_part_unchecked(query: str,
+                                    drop_keys_set: Optional[frozenset]
+                                    ) -> str:
+    """normalize_query_part without checking the parameters. For callers
+       which know query is just the query part of an URL."""
     if '=' not in query:
         # RFC 3986 prescribes a key=value syntax, but some old implementations
         # do not follow that and generate URLs like:
@@ -58,36 +166,65 @@ def normalize_query_part(query: str,
         # In this case the query part is not changed.
         return query
 
-    chunks = query.split('&')
     keep: Dict[str, str] = dict()
-    for chunk in chunks:
-        if chunk != '' and '=' in chunk:
-            split_chunk = chunk.split('=')
-            key = split_chunk[0]
-            value = split_chunk[1]
-            if key != '' and value != '':
-                if key in keep:
-                    # i.e. we already processed the same key
-                    if keep[key] != value:
-                        raise err.QueryKeyConflict(
-                            'Duplicate URL query key with conflicting values')
-                    logging.debug(
-                        'Duplicate key in URL query part, but no conflict.')
-                elif drop_keys and key in drop_keys:
-                    # i.e. the key is in the list of keys to drop
-                    pass
-                else:
-                    keep[key] = value
-    ordered = list()
-    if keep:
-        for key in sorted(keep):
-            ordered.append(f"{key}={keep[key]}")
-
-    return '&'.join(ordered) if ordered else ''
+    for chunk in query.split('&'):
+        key, _, value = chunk.partition('=')
+        if '=' in value:
+            # like 'key=1=2': only the part up to the second '=' counts
+            value = value.partition('=')[0]
+        if key != '' and value != '':
+            if key in keep:
+                # i.e. we already processed the same key
+                if keep[key] != value:
+                    raise err.QueryKeyConflict(
+                        'Duplicate URL query key with conflicting values')
+                logging.debug(
+                    'Duplicate key in URL query part, but no conflict.')
+            elif drop_keys_set and key in drop_keys_set:
+                # i.e. the key is in the list of keys to drop
+                pass
+            else:
+                keep[key] = value
+
+    return '&'.join(f"{key}={keep[key]}" for key in sorted(keep))
+
+
+# An http(s) URL with lowercase host, without port, userinfo or fragment.
+# Checked before parsing to return already normalized URLs unchanged.
+_canonical_url_match = re.compile(
+    r"https?://[a-z0-9.\-]+(/[^?#\s]*)?(?:\?([^#\s]+))?").fullmatch
+
+
+def _is_canonical_url(url: str,
+                      check_query: bool = True) -> bool:
+    """True if normalize_url would return the URL unchanged. Checks the
+       string only, so a False does not mean the URL needs a change."""
+    match = _canonical_url_match(url)
+    if match is None:
+        return False
+    path, query = match.groups()
+    if path and ('//' in path or path.endswith(';')):
+        return False
+    if query is None or not check_query:
+        return True
+    if '=' not in query:
+        # query without key, left unchanged
+        return True
+    previous_key = ''
+    for chunk in query.split('&'):
+        key, _, value = chunk.partition('=')
+        # Keys must be sorted and unique, values non-empty:
+        if key <= previous_key or value == '' or '=' in value:
+            return False
+        previous_key = key
+    return True
+
+
+_STANDARD_PORTS = {'http': 80, 'https': 443}
 
 
 def normalize_url(url: str,
-                  drop_keys: Union[list, tuple, set, None] = None,
+                  drop_keys: Union[list, tuple, set, frozenset, None] = None,
                   do_not_change_query_part: bool = False) -> str:
     """Normalize an URL:
        * remove whitespace around it,
@@ -103,56 +240,199 @@ def normalize_url(url: str,
        The option do_not_change_query_part is there, because some content
        management systems use duplicate keys with different values. Sometimes
        that must not raise an exception."""
-    url = url.strip()
-
-    if not is_url(url):
-        raise ValueError('Malformed URL')
-
     if drop_keys and do_not_change_query_part:
         raise err.ContradictoryParameters(
             'Cannot drop keys AND leave the query part unchanged.')
+    return _normalize_url_unchecked(url,
+                                    _drop_keys_set(drop_keys),
+                                    do_not_change_query_part)
+
 
-    # Remove fragments (https://www.example.com#foo -> https://www.example.com)
-    url, _ = urllib.parse.urldefrag(url)
+def _normalize_url_unchecked(url: str,
+                             drop_keys_set: Optional[frozenset],
+                             do_not_change_query_part: bool) -> str:
+    """normalize_url after the parameters have been checked and drop_keys
+       has been converted. normalize_urls calls this for every URL."""
+    url = url.strip()
+    if not drop_keys_set and _is_canonical_url(url,
+                                               not do_not_change_query_part):
+        # Most URLs are already normalized.
+        return url
+
+    # Split only once. The fragment (like #foo) is simply not reassembled.
+    parsed = _urlsplit(url)
 
-    standard_ports = {'http': 80, 'https': 443}
+    if not _is_url_split(parsed):
+        raise ValueError('Malformed URL')
 
-    parsed = urllib.parse.urlparse(url)
-    reassemble = list()
-    reassemble.append(parsed.scheme.lower())
+    # urlsplit already converts the scheme to lowercase
+    scheme = parsed.scheme
+    # parsed.port parses the netloc on each access:
+    port = parsed.port
 
-    if not parsed.port:
+    if not port:
         # There is no port to begin with
         # hostname is lowercase without port
-        reassemble.append(parsed.hostname)  # type: ignore[arg-type]
-    elif (parsed.scheme in standard_ports and
-            parsed.port == standard_ports[parsed.scheme]):
+        netloc = parsed.hostname
+    elif port == _STANDARD_PORTS.get(parsed.scheme):
         # There is a port and it equals the standard.
         # That means it is redundant.
-        reassemble.append(parsed.hostname)  # type: ignore[arg-type]
+        netloc = parsed.hostname
     else:
         # There is a port but it is not in the list or not standard
-        reassemble.append(f"{parsed.hostname}:{parsed.port}")
-
-    # remove common typo (// in path element):
-    reassemble.append(parsed.path.replace('//', '/'))
-
-    # do not change parameters of the path element (!= query)
-    reassemble.append(parsed.params)
-
-    if do_not_change_query_part:
-        reassemble.append(parsed.query)
-    else:
-        reassemble.append(normalize_query_part(parsed.query, drop_keys))
-
-    # urlunparse expects a fifth element (the already removed fragment)
-    reassemble.append('')
-
-    url = urllib.parse.urlunparse(reassemble)
-
-    return url
+        netloc = f"{parsed.hostname}:{port}"
 
+    path = parsed.path
+    if path.endswith(';') and scheme in urllib.parse.uses_params:
+        # urlparse used to split off the parameters of the last path
+        # segment (like ';jsessionid=1'), so empty ones were dropped.
+        last_segment = path[path.rfind('/') + 1:]
+        if last_segment.find(';') == len(last_segment) - 1:
+            path = path[:-1]
 
+    # remove common typo (// in path element):
+    while '//' in path:
+        # A single replace would turn //// into //.
+        path = path.replace('//', '/')
+
+    query = parsed.query
+    if query and not do_not_change_query_part:
+        query = _normalize_query_part_unchecked(query, drop_keys_set)
+
+    if not netloc:
+        # No hostname (like in 'http://@/'): leave the special cases
+        # to urlunsplit. The fragment (like #foo) is removed.
+        return urllib.parse.urlunsplit((scheme, netloc, path, query, ''))
+    # Concatenate directly: scheme and hostname are known to be there
+    # and the path is either empty or starts with a slash.
+    if query:
+        return f"{scheme}://{netloc}{path}?{query}"
+    return f"{scheme}://{netloc}{path}"
+
+
+def normalize_urls(urls: Iterable[str],
+                   drop_keys: Union[list, tuple, set, frozenset, None] = None,
+                   do_not_change_query_part: bool = False,
+                   workers: int = 1) -> Iterator[str]:
+    """Normalize multiple URLs with the same options as normalize_url.
+       The parameters are checked and converted only once, not per URL.
+       Errors like a malformed URL are raised while iterating over the
+       result, once the iterator reaches that URL.
+       With workers above 1, the URLs are distributed to that many
+       processes. That only pays off for large batches. All URLs are
+       normalized before the first result is returned. On platforms
+       that start processes with 'spawn' (Windows, macOS), the calling
+       code must be guarded with: if __name__ == '__main__':"""
+    if drop_keys and do_not_change_query_part:
+        raise err.ContradictoryParameters(
+            'Cannot drop keys AND leave the query part unchanged.')
+    if workers < 1:
+        raise ValueError('workers must be at least 1')
+    drop_keys_set = _drop_keys_set(drop_keys)
+    if workers == 1:
+        return map(functools.partial(
+            _normalize_url_unchecked,
+            drop_keys_set=drop_keys_set,
+            do_not_change_query_part=do_not_change_query_part), urls)
+    normalize = functools.partial(
+        _normalize_url_or_error,
+        drop_keys_set=drop_keys_set,
+        do_not_change_query_part=do_not_change_query_part)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # chunks amortize the cost of sending URLs to the processes
+        results = list(executor.map(normalize, urls, chunksize=1024))
+    return _raise_in_order(results)
+
+
+def _normalize_url_or_error(url: str,
+                            drop_keys_set: Optional[frozenset],
+                            do_not_change_query_part: bool
+                            ) -> Union[str, Exception]:
+    """Run in the worker processes of normalize_urls: return an exception
+       instead of raising it, so it is raised at the position of its URL."""
+    try:
+        return _normalize_url_unchecked(url, drop_keys_set,
+                                        do_not_change_query_part)
+    except Exception as error:
+        return error
+
+
+def _raise_in_order(results: List[Union[str, Exception]]) -> Iterator[str]:
+    "Yield the results of the worker processes, raise returned exceptions."
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+        yield result
+
+
+def canonical_key(url: str,
+                  drop_keys: Union[list, tuple, set, frozenset, None] = None
+                  ) -> int:
+    """A 64 bit key to deduplicate URLs: URLs with the same normalized
+       form (see normalize_url) get the same key. Storing the keys instead
+       of the URLs saves memory. Collisions are possible, but unlikely
+       for less than billions of URLs."""
+    normalized = normalize_url(url, drop_keys)
+    hasher = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8)
+    return int.from_bytes(hasher.digest(), 'big')
+
+
+# Extensions returned by mimetypes that are replaced with a more common one:
+_EXTENSION_FIXES: Dict[Optional[str], str] = {'.htm': '.html'}
+
+
+# The most common types on the web. Looked up before the mimetypes module,
+# which would have to load its database first.
+_COMMON_EXTENSIONS = {
+    'text/html': '.html',
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'text/plain': '.txt',
+    'application/pdf': '.pdf',
+    'application/json': '.json',
+    'application/zip': '.zip',
+    'image/gif': '.gif',
+    'application/xml': '.xml',
+    'text/css': '.css',
+    'application/javascript': '.js'
+}
+_COMMON_TYPES = {
+    'html': 'text/html',
+    'htm': 'text/html',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'txt': 'text/plain',
+    'pdf': 'application/pdf',
+    'json': 'application/json',
+    'zip': 'application/zip',
+    'gif': 'image/gif',
+    'css': 'text/css'
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _guess_type(path: str) -> Optional[str]:
+    "Cached mimetypes.guess_type returning only the type."
+    head, _, suffix = path.rpartition('.')
+    if suffix in _COMMON_TYPES:
+        # Same rule as os.path.splitext: a filename consisting only of
+        # dots and the extension (like '.html') has no extension.
+        if head.rpartition('/')[2].strip('.'):
+            return _COMMON_TYPES[suffix]
+    return mimetypes.guess_type(path)[0]
+
+
+@functools.lru_cache(maxsize=256)
+def _guess_extension(mime_type: str) -> Optional[str]:
+    "Cached mimetypes.guess_extension. There are few distinct mime types."
+    extension = _COMMON_EXTENSIONS.get(mime_type)
+    if extension is not None:
+        return extension
+    return mimetypes.guess_extension(mime_type)
+
+
+@functools.lru_cache(maxsize=2048)
 def determine_file_extension(url: str,
                              provided_mime_type: Optional[str] = None) -> str:
     """Guess the correct filename extension from an URL and / or
@@ -160,48 +440,50 @@ def determine_file_extension(url: str,
     Sometimes a valid URL does not contain a file extension
     (like https://www.example.com/), or it is ambiguous.
     So the mime type acts as a fallback. In case the correct
-    extension cannot be determined at all it is set to 'unknown'."""
+    extension cannot be determined at all it is set to 'unknown'.
+    Results are cached (up to 2048 combinations of arguments). Call
+    determine_file_extension.cache_clear() to free that memory."""
     if provided_mime_type:
         provided_mime_type = provided_mime_type.strip()
     if provided_mime_type == '':
         provided_mime_type = None
 
-    extension: Optional[str] = None
     type_by_url: Optional[str] = None
+    # urlparse instead of urlsplit: for schemes like http it removes
+    # parameters like ';jsessionid=1', which would hide the extension.
     parsed_url = urllib.parse.urlparse(url)
     if parsed_url.path not in ('', '/'):
-        type_by_url = mimetypes.guess_type(parsed_url.path)[0]
+        type_by_url = _guess_type(parsed_url.path)
 
+    extension: Optional[str] = None
     if type_by_url is not None and type_by_url == provided_mime_type:
         # Best case: URL and server header suggest the same filetype.
-        extension = mimetypes.guess_extension(provided_mime_type)
+        extension = _guess_extension(provided_mime_type)
     elif type_by_url is None and provided_mime_type is not None:
         # The URL does not contain an usable extension, but
         # the server provides a mime type.
-        extension = mimetypes.guess_extension(provided_mime_type)
+        extension = _guess_extension(provided_mime_type)
         if extension is None:
             logging.error('No hint in URL and mime-type malformed for %s', url)
             return '.unknown'
     elif type_by_url is not None and provided_mime_type is None:
         # There is a usable file extension in the URL, but the misconfigured
         # server does not provide a mime type.
-        extension = mimetypes.guess_extension(type_by_url)
+        extension = _guess_extension(type_by_url)
         # Here no code for extension is None, because mimetypes already
         # guessed a type once we got here and can guess a matching extension.
     elif type_by_url is None and provided_mime_type is None:
         # Neither the URL nor the server does hint to a extension
-        msg = (f"Neither URL ({url}) nor mime-type ({provided_mime_type}) " +
-               "suggests a file extension.")
-        logging.error(msg)
+        logging.error('Neither URL (%s) nor mime-type (%s) suggests a '
+                      'file extension.', url, provided_mime_type)
         return '.unknown'
     elif type_by_url != provided_mime_type:
         # The suggestions contradict each other
-        msg = (f"The mime type ({type_by_url}) suggested by the URL ({url}) " +
-               "does not match the mime type supplied by the server " +
-               f"({provided_mime_type}). Using the extension suggested " +
-               "by the URL.")
-        logging.error(msg)
-        extension = mimetypes.guess_extension(type_by_url)  # type: ignore[arg-type]
+        logging.error('The mime type (%s) suggested by the URL (%s) does '
+                      'not match the mime type supplied by the server (%s). '
+                      'Using the extension suggested by the URL.',
+                      type_by_url, url, provided_mime_type)
+        extension = _guess_extension(type_by_url)
 
     # Handle errors and irregularities in mimetypes:
     if extension == '.bat' and provided_mime_type == 'text/plain':
@@ -209,10 +491,4 @@ def determine_file_extension(url: str,
         # Python 3.8 correctly guesses .txt as extension.
         return '.txt'
 
-    if extension == '.htm':
-        return '.html'
-
-    if extension is None:
-        return '.unknown'
-
-    return extension
+    return _EXTENSION_FIXES.get(extension, extension) or '.unknown'